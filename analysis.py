@@ -1,6 +1,8 @@
-from datetime import datetime, timedelta
+from math import sin
 
-from astral import LocationInfo, moon, sun
+import numpy as np
+import pandas as pd
+from astral.table4 import Gm, Fm, D, Om, Ls, Gs, L2, table4_u, table4_v, table4_w
 
 
 class Filter:
@@ -12,27 +14,228 @@ class Filter:
     def evalulate(self, value):
         return True
 
+    @staticmethod
+    def combine(filters, df):
+        """Evaluate filters on `df` and AND them together into a single boolean mask
+
+        Each comparison is written into the same scratch buffer, rather than allocating a new array per filter.
+
+        :param list filters: Filter objects which support `evaluate(df, out=...)`
+        :param pd.DataFrame df: data to evaluate the filters on
+        :return: np.ndarray of bool, True where every filter passes
+        """
+        mask = np.ones(len(df), dtype=bool)
+        scratch = np.empty(len(df), dtype=bool)
+        for filter in filters:
+            filter.evaluate(df, out=scratch)
+            mask &= scratch
+        return mask
+
 
 class FilterLessThan(Filter):
     def __init__(self, column, value):
         super().__init__(column, value)
         self.comparitor = "<"
 
-    def evaluate(self, df):
-        return df[self.column] < self.value
+    def evaluate(self, df, out=None):
+        return np.less(df[self.column].to_numpy(), self.value, out=out)
+
+
+def _fraction(revolutions):
+    """Fractional part of a number of revolutions, truncating like astral does"""
+    return revolutions - np.trunc(revolutions)
+
+
+def _julian_day(dt64_array):
+    """Convert an array of UTC datetime64 values to Julian days
+
+    Sub-second precision is dropped, matching `astral.julian.julianday`.
+    """
+    seconds = np.ascontiguousarray(dt64_array, dtype="datetime64[s]").astype(np.int64)
+    return seconds / 86400.0 + 2440587.5
 
 
-def _get_astral_observer(latitude, longitude, elevation, timezone):
-    location_info = LocationInfo(
-        "_name",
-        "_region",
-        timezone,
-        latitude,
-        longitude,
+def _sun_elevation(jd, latitude, longitude):
+    """Vectorized port of `astral.sun.elevation` (NOAA solar position, with refraction)"""
+    t = (jd - 2451545.0) / 36525.0
+
+    mean_long = np.radians((280.46646 + t * (36000.76983 + 0.0003032 * t)) % 360.0)
+    mean_anomaly = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    eccentricity = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    eq_of_center = (
+        np.sin(mean_anomaly) * (1.914602 - t * (0.004817 + 0.000014 * t))
+        + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * t)
+        + np.sin(3 * mean_anomaly) * 0.000289
+    )
+
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_long = np.radians(
+        np.degrees(mean_long) + eq_of_center - 0.00569 - 0.00478 * np.sin(omega)
+    )
+    seconds = 21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))
+    obliquity = np.radians(
+        23.0 + (26.0 + seconds / 60.0) / 60.0 + 0.00256 * np.cos(omega)
+    )
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_long))
+
+    # Equation of time, in minutes
+    y = np.tan(obliquity / 2.0) ** 2
+    eq_of_time = 4.0 * np.degrees(
+        y * np.sin(2 * mean_long)
+        - 2.0 * eccentricity * np.sin(mean_anomaly)
+        + 4.0 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * mean_long)
+        - 0.5 * y * y * np.sin(4 * mean_long)
+        - 1.25 * eccentricity * eccentricity * np.sin(2 * mean_anomaly)
+    )
+
+    minutes_of_day = ((jd - 0.5) % 1.0) * 1440.0
+    true_solar_time = minutes_of_day + eq_of_time + 4.0 * longitude
+    hour_angle = np.radians(true_solar_time / 4.0 - 180.0)
+
+    latitude = np.radians(min(max(latitude, -89.8), 89.8))
+    cos_zenith = np.clip(
+        np.cos(latitude) * np.cos(declination) * np.cos(hour_angle)
+        + np.sin(latitude) * np.sin(declination),
+        -1.0,
+        1.0,
+    )
+    elevation = 90.0 - np.degrees(np.arccos(cos_zenith))
+
+    # Atmospheric refraction, in arc seconds (see `astral.refraction_at_zenith`)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        te = np.tan(np.radians(elevation))
+        refraction = np.select(
+            [elevation >= 85.0, elevation > 5.0, elevation > -0.575],
+            [
+                0.0,
+                58.1 / te - 0.07 / te**3 + 0.000086 / te**5,
+                1735.0
+                + elevation
+                * (
+                    -518.2
+                    + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711))
+                ),
+            ],
+            -20.774 / te,
+        )
+    return elevation + refraction / 3600.0
+
+
+# Fundamental arguments of the lunar theory as `(value at J2000, revolutions per day)`
+_MOON_ARGUMENTS = {
+    Gm: (0.374897, 0.03629164709),  # Moon mean anomaly
+    Fm: (0.259091, 0.03674819520),  # Moon argument of latitude
+    D: (0.827362, 0.03386319198),  # Moon mean elongation from sun
+    Om: (0.606434 - 0.259091, 0.03660110129 - 0.03674819520),  # Lunar ascending node
+    Ls: (0.779072, 0.00273790931),  # Sun mean longitude
+    Gs: (0.993126, 0.00273777850),  # Sun mean anomaly
+    L2: (0.505498, 0.00445046867),  # Venus mean longitude
+}
+
+
+def _linearize_series(table):
+    """Reduce each row of an astral lunar series to `(coefficient, phase, rate, trig, t)`
+
+    Every argument multiplier is an integer, so the whole revolutions that astral truncates from each argument do not
+    change the sine or cosine of a row. Each row's angle is then just `phase + rate * jd2000` revolutions.
+    """
+    series = []
+    for row in table:
+        phase, rate = 0.0, 0.0
+        for arg, multiplier in row.argument_multiplers.items():
+            phase += multiplier * _MOON_ARGUMENTS[arg][0]
+            rate += multiplier * _MOON_ARGUMENTS[arg][1]
+        trig = np.sin if row.sincos is sin else np.cos
+        series.append((row.coefficient, phase, rate, trig, row.t))
+    return series
+
+
+_MOON_SERIES_V = _linearize_series(table4_v)
+_MOON_SERIES_U = _linearize_series(table4_u)
+_MOON_SERIES_W = _linearize_series(table4_w)
+
+
+def _moon_series(series, jd2000, t):
+    """Sum one of the trigonometric series from astral's low-precision lunar theory"""
+    result = np.zeros_like(jd2000)
+    for coefficient, phase, rate, trig, uses_t in series:
+        term = coefficient * trig(2 * np.pi * (phase + rate * jd2000))
+        result += term * t if uses_t else term
+    return result
+
+
+def _moon_elevation(jd, latitude, longitude):
+    """Vectorized port of `astral.moon.elevation`"""
+    jd2000 = jd - 2451545.0
+    mean_long = _fraction(0.606434 + 0.03660110129 * jd2000)
+
+    t = jd2000 / 36525 + 1
+    v = _moon_series(_MOON_SERIES_V, jd2000, t)
+    u = _moon_series(_MOON_SERIES_U, jd2000, t)
+    w = _moon_series(_MOON_SERIES_W, jd2000, t)
+
+    right_ascension = np.arcsin(w / np.sqrt(u - v * v)) + mean_long * 2 * np.pi
+    declination = np.arcsin(v / np.sqrt(u))
+
+    t0 = jd2000 / 36525
+    sidereal_time = (
+        280.46061837 + 360.98564736629 * jd2000 + 0.000387933 * t0**2 + t0**3 / 38710000
+    ) % 360 + longitude
+    hour_angle = np.radians(sidereal_time) - right_ascension
+
+    sh, ch = np.sin(hour_angle), np.cos(hour_angle)
+    sd, cd = np.sin(declination), np.cos(declination)
+    sl, cl = np.sin(np.radians(latitude)), np.cos(np.radians(latitude))
+
+    x = -ch * cd * sl + sd * cl
+    y = -sh * cd
+    z = ch * cd * cl + sd * sl
+    return np.degrees(np.arctan2(z, np.sqrt(x * x + y * y)))
+
+
+def _moon_phase(jd):
+    """Vectorized port of `astral.moon.phase`, from 0 to 27.99 (14 is a full moon)"""
+    dt = (jd - 2382148) ** 2 / (41048480 * 86400)
+    t = (jd + dt - 2451545.0) / 36525
+
+    d = np.radians(
+        (297.85 + 445267.1115 * t - 0.0016300 * t**2 + t**3 / 545868) % 360.0
+    )
+    m = np.radians((357.53 + 35999.0503 * t) % 360.0)
+    m1 = np.radians(
+        (134.96 + 477198.8676 * t + 0.0089970 * t**2 + t**3 / 69699) % 360.0
+    )
+
+    elongation = (
+        np.degrees(d)
+        + 6.29 * np.sin(m1)
+        - 2.10 * np.sin(m)
+        + 1.27 * np.sin(2 * d - m1)
+        + 0.66 * np.sin(2 * d)
+    )
+    elongation = np.floor(elongation % 360.0)
+    phase = (elongation + 6.43) / 360 * 28
+    return np.where(phase >= 28.0, phase - 28.0, phase)
+
+
+def _vectorized_sun_moon(dt64_array, latitude, longitude, elevation):
+    """Compute sun elevation, moon elevation, and moon phase for an array of UTC times
+
+    These are NumPy ports of the astral formulae, evaluated over the whole array at once rather than one timestamp at a
+    time. Like astral, the elevations are for an observer at sea level, so `elevation` is currently unused.
+
+    :param np.ndarray dt64_array: UTC timestamps as datetime64
+    :param float latitude: Observer latitude in degrees
+    :param float longitude: Observer longitude in degrees
+    :param float elevation: Observer elevation in meters
+    :return: tuple of `(sun_elevation, moon_elevation, moon_phase)` arrays
+    """
+    jd = _julian_day(dt64_array)
+    return (
+        _sun_elevation(jd, latitude, longitude),
+        _moon_elevation(jd, latitude, longitude),
+        _moon_phase(jd),
     )
-    observer = location_info.observer
-    observer.elevation = elevation
-    return observer
 
 
 def compute_astral_values(data, latitude, longitude, elevation, timezone):
@@ -44,26 +247,50 @@ def compute_astral_values(data, latitude, longitude, elevation, timezone):
      - "sun_elevation" above the horizon in degrees
 
     :param pd.DataFrame data: SQM data, which must have a "datetime" column defined
-    :param astral.Observer observer: Observer object with latitude, longitude, and elevation
+    :param float latitude: Observer latitude in degrees
+    :param float longitude: Observer longitude in degrees
+    :param float elevation: Observer elevation in meters
+    :param str timezone: Observer timezone name
     """
-    observer = _get_astral_observer(latitude, longitude, elevation, timezone)
+    sun_elevation, moon_elevation, moon_phase = _vectorized_sun_moon(
+        data["datetime"].values, latitude, longitude, elevation
+    )
 
     # Get moon phase from 0 (new moon) to 1 (full moon)
-    data["moon_phase"] = [moon.phase(dt) for dt in data["datetime"]]
-    mp = data["moon_phase"]
-    data["moon_phase"] = (
-        1 - abs(mp - 14) / 14.0
+    moon_phase = (
+        1 - np.abs(moon_phase - 14) / 14.0
     )  # 14 is a full moon, < 14 is waxing, > 14 is waning
 
-    # Get moon and sun elevations
-    data["moon_elevation"] = [
-        moon.elevation(observer, at=dt)
-        #            max(moon.elevation(_observer, at=dt), 0)
-        for dt in data["datetime"]
-    ]
-    data["sun_elevation"] = [
-        sun.elevation(observer, dateandtime=dt) for dt in data["datetime"]
-    ]
+    # Stored as float32, which is still far more precise than the formulae themselves
+    data["moon_phase"] = moon_phase.astype(np.float32)
+    data["moon_elevation"] = moon_elevation.astype(np.float32)
+    data["sun_elevation"] = sun_elevation.astype(np.float32)
+
+
+def _group_bounds(new_group, is_night):
+    """Find the row positions of the first and last row of each group, and whether each group is a night
+
+    :param np.ndarray new_group: bool array that is True on the first row of each group
+    :param np.ndarray is_night: bool array of night values for each row
+    :return: tuple of `(starts, ends, is_night)` arrays with one value per group
+    """
+    starts = np.flatnonzero(new_group)
+    ends = starts[1:] - 1
+    if starts.size:
+        ends = np.append(ends, len(new_group) - 1)
+    return starts, ends, is_night[starts]
+
+
+def get_group_bounds(df):
+    """Get the first row, last row, and night value of each group labelled by `label_days_and_nights`
+
+    :param pd.DataFrame df: SQM data with "is_night" and "group" columns
+    :return: tuple of `(starts, ends, is_night)` arrays with one value per group
+    """
+    codes = df["group"].cat.codes.to_numpy()
+    new_group = np.ones(len(codes), dtype=bool)
+    new_group[1:] = codes[1:] != codes[:-1]
+    return _group_bounds(new_group, df["is_night"].to_numpy())
 
 
 def label_days_and_nights(df, elevation, night_filters=[]):
@@ -71,7 +298,11 @@ def label_days_and_nights(df, elevation, night_filters=[]):
 
     This adds the following columns to `df`
       - "is_night" - bool if it is night according to the night_filters
-      - "group" - a string like "day_1" or "night_2" uniquely identifying consecutive timepoints with same night value
+      - "group" - a category like "day_1" or "night_2" uniquely identifying consecutive timepoints with same night value,
+        so every row in a "night" group has "is_night" set and vice versa
+
+    The bounds of each group are returned in the same form as `get_group_bounds`, so they do not need to be found again
+    from the "group" column.
 
     Note that it is possible to get something like "night_3, day_4, night_5" all within a single night, for instance
     during a full moon. There may be a brief period after the sun goes down before the moon comes up at dusk, and
@@ -81,26 +312,23 @@ def label_days_and_nights(df, elevation, night_filters=[]):
     nn    nnnn    nnnn    nnnn   nnn
     |=======|=======|=======|======|
 
+    :return: tuple of `(starts, ends, is_night)` arrays with one value per group
     """
-    previous_dt = datetime.fromisoformat("1990-01-01T00:00:00.000Z")
-    previous_group = "night"
-    group_idx = -1
-    group_labels = []
-
-    df["is_night"] = True
-    for filter in night_filters:
-        df["is_night"] = (df["is_night"]) & (filter.evaluate(df))
-    for idx in df.index:
-        dt = df.loc[idx, "datetime"]
-        night = df.loc[idx, "is_night"]
-        new_group = "night" if night else "day"
-        if dt - previous_dt > timedelta(hours=12):
-            group_idx += 1
-        elif night and previous_group == "day":
-            group_idx += 1
-        elif not night and previous_group == "night":
-            group_idx += 1
-        group_labels.append(f"{new_group}_{group_idx}")
-        previous_group = new_group
-        previous_dt = dt
-    df["group"] = group_labels
+    is_night = Filter.combine(night_filters, df)
+    df["is_night"] = is_night
+
+    # A new group starts whenever the night value changes, or after a gap of more than 12 hours in the data
+    dt = df["datetime"].values
+    new_group = np.ones(len(df), dtype=bool)
+    new_group[1:] = (np.diff(dt) > np.timedelta64(12, "h")) | (
+        is_night[1:] != is_night[:-1]
+    )
+    group_idx = np.cumsum(new_group) - 1
+
+    # Only one label per group needs to be built, rows just store the index of their group
+    group_labels = [
+        f"{'night' if night else 'day'}_{idx}"
+        for idx, night in enumerate(is_night[new_group])
+    ]
+    df["group"] = pd.Categorical.from_codes(group_idx, categories=group_labels)
+    return _group_bounds(new_group, is_night)
@@ -1,6 +1,10 @@
+import hashlib
 import os
+from io import BytesIO
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import streamlit as st
 
 from sqm import SQM
@@ -9,6 +13,7 @@ from plots import make_sqm_plot
 
 DEFAULT_MOON_ELEVATION_FILTER = 5
 DEFAULT_SUN_ELEVATION_FILTER = -15
+DEMO_DATA_PATH = "data/April24.dat"
 
 
 def _clear_data():
@@ -25,10 +30,35 @@ def _clear_data():
         st.session_state["using_demo_data"] = False
 
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def _load_sqm(file_bytes):
+    """Parse an SQM file, cached on its contents so that loading the same file again is free
+
+    `st.cache_data` gives each caller its own copy, so sessions can safely add columns to `device.data`.
+    """
+    return SQM(BytesIO(file_bytes))
+
+
+def _load_device(uploaded_file):
+    """Load an uploaded file, or the file at the given path, into the session state
+
+    :return: the loaded SQM device
+    """
+    if isinstance(uploaded_file, str):
+        with open(uploaded_file, "rb") as infile:
+            file_bytes = infile.read()
+    else:
+        file_bytes = uploaded_file.getvalue()
+
+    device = _load_sqm(file_bytes)
+    st.session_state["device"] = device
+    st.session_state["file_hash"] = hashlib.sha256(file_bytes).hexdigest()
+    return device
+
+
 def _load_demo_data():
     """Loads a demo dataset from the Wehle Forever Wild Tract, April 2024"""
-    device = SQM("data/April24.dat")
-    st.session_state["device"] = device
+    _load_device(DEMO_DATA_PATH)
     st.session_state["using_demo_data"] = True
 
 
@@ -48,20 +78,47 @@ def format_device_title(device):
     return f"{loc_name} - {loc_id}"
 
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def _compute_astral_values(
+    file_hash, _datetimes, latitude, longitude, elevation, timezone
+):
+    """Compute moon and sun values, cached per file and location
+
+    The sun and moon values do not depend on the night filters, so they only need to be computed once per file.
+    `_datetimes` is not hashed by streamlit, the file is identified by `file_hash` instead.
+
+    :return: dict mapping column names to arrays of values
+    """
+    astral_df = pd.DataFrame({"datetime": _datetimes})
+    compute_astral_values(astral_df, latitude, longitude, elevation, timezone)
+    return {
+        column: astral_df[column].to_numpy()
+        for column in ["moon_phase", "moon_elevation", "sun_elevation"]
+    }
+
+
 @st.cache_data
 def _prepare_df_for_download(df):
-    df = df.copy()
-    columns = list(df.columns)
-    columns[0] = "datetime_utc"
-    columns[1] = "datetime_local"
-    columns[2] = "temperature"
-    columns[3] = "voltage"
-    columns[4] = "msas"
-    columns[5] = "record_type"
-    df.columns = columns
-    cols = [i for i in columns if i not in ["datetime", "local_datetime"]]
-    df = df[cols]
-    return df.to_csv(index=None).encode("utf-8")
+    columns = [i for i in df.columns if i not in ["datetime", "local_datetime"]]
+    names = [str(i) for i in columns]
+    names[0] = "datetime_utc"
+    names[1] = "datetime_local"
+    names[2] = "temperature"
+    names[3] = "voltage"
+    names[4] = "msas"
+    names[5] = "record_type"
+
+    # Building an Arrow table avoids a full `df.copy()`, and Arrow formats the csv in C++ rather than pandas formatting
+    # each value in Python
+    table = pa.Table.from_pandas(df, columns=columns, preserve_index=False)
+    buffer = BytesIO()
+    buffer.write((",".join(names) + "\n").encode("utf-8"))
+    pa_csv.write_csv(
+        table,
+        buffer,
+        write_options=pa_csv.WriteOptions(include_header=False, quoting_style="none"),
+    )
+    return buffer.getvalue()
 
 
 @st.fragment
@@ -128,8 +185,7 @@ st.button(
 )
 if uploaded_file is not None or st.session_state["using_demo_data"]:
     if st.session_state["device"] is None:
-        device = SQM(uploaded_file)
-        st.session_state["device"] = device
+        device = _load_device(uploaded_file)
     else:
         device = st.session_state["device"]
 
@@ -139,6 +195,7 @@ if uploaded_file is not None or st.session_state["using_demo_data"]:
     ]
 
     location_info_specified = False
+    group_bounds = None
     if device.latitude is not None and device.longitude is not None:
         location_info_specified = True
         lat, lon, elev = device.latitude, device.longitude, device.elevation
@@ -147,8 +204,19 @@ if uploaded_file is not None or st.session_state["using_demo_data"]:
         map_df["lat"] = [lat]
         map_df["lon"] = [lon]
 
-        compute_astral_values(device.data, lat, lon, elev, device.timezone.key)
-        label_days_and_nights(device.data, elev, night_filters=night_filters)
+        astral_values = _compute_astral_values(
+            st.session_state["file_hash"],
+            device.data["datetime"],
+            lat,
+            lon,
+            elev,
+            device.timezone.key,
+        )
+        for column, values in astral_values.items():
+            device.data[column] = values
+        group_bounds = label_days_and_nights(
+            device.data, elev, night_filters=night_filters
+        )
 
     st.header(format_device_title(device))
 
@@ -162,13 +230,14 @@ if uploaded_file is not None or st.session_state["using_demo_data"]:
             icon=":material/warning:",
         )
 
-    fig = make_sqm_plot(device.data)
+    fig = make_sqm_plot(device.data, group_bounds)
     st.plotly_chart(fig, use_container_width=True)
     if location_info_specified:
         _add_fragment_download_button(uploaded_file)
 
-    if "group" in device.data.columns:
-        night_df = device.data.loc[device.data["group"].str.startswith("night")]
+    if "is_night" in device.data.columns:
+        # Groups never mix day and night rows, so this selects exactly the rows of the "night" groups
+        night_df = device.data.loc[device.data["is_night"]]
     else:
         night_df = device.data
     mean_msas = night_df[4].mean()
@@ -242,6 +311,10 @@ with st.sidebar:
             There is a button below the plots to download the dataset as a plain-text .csv file. This file includes all
             the columns from the original SQM data, as well as the moon, sun, and day/night labels. It also includes an
             estimated calculation of the Naked Eye Limiting Magnitude (NELM).
+
+            Whole numbers are written without a decimal point (for example a reading of `0.00` is written as `0`),
+            the day/night column is written as `true`/`false`, and a value missing from the original file is left
+            empty.
         """)
 
     with st.expander("How can I save a copy of the plot?"):
@@ -271,9 +344,8 @@ with st.sidebar:
             HEADER`
             line!)
 
-            Afterwords, make sure the `# Number of header lines:` value is still correct. If you added an entirely new
-            line then you should increase the number by 1. If you just filled your lat, lon, and elevation values into
-            an existing line, then you will not need to modify the `# Number of header lines:` value.
+            The `# Number of header lines:` value does not need to be changed, since the header is read up to the
+            `# END OF HEADER` line.
         """)
 
     with st.expander(
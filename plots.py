@@ -2,10 +2,11 @@ from datetime import timedelta
 
 import plotly.graph_objects as go
 
+from analysis import get_group_bounds
 from sqm import SQM
 
 
-def make_sqm_plot(df):
+def make_sqm_plot(df, group_bounds=None):
     fig = go.Figure()
 
     fig.add_trace(
@@ -106,19 +107,18 @@ def make_sqm_plot(df):
         NIGHT_COLOR = "rgba(64, 64, 255, 0.2)"
         DAY_COLOR = "rgba(255, 200, 32, 0.2)"
         shapes = []
-        gb = df.groupby("group")
-        group_starts = gb["local_datetime"].min()
-        group_ends = gb["local_datetime"].max()
-        for group in gb.groups:
-            x0, x1 = group_starts[group], group_ends[group]
-            color = NIGHT_COLOR if "night" in group else DAY_COLOR
+        local_datetimes = df["local_datetime"]
+        if group_bounds is None:
+            group_bounds = get_group_bounds(df)
+        for start, end, night in zip(*group_bounds):
+            color = NIGHT_COLOR if night else DAY_COLOR
             shapes.append(
                 dict(
                     fillcolor=color,
                     line={"width": 0},
                     type="rect",
-                    x0=x0,
-                    x1=x1,
+                    x0=local_datetimes.iat[start],
+                    x1=local_datetimes.iat[end],
                     y0=0,
                     y1=1,
                     yref="paper",
@@ -126,5 +126,4 @@ def make_sqm_plot(df):
             )
         fig.update_layout(shapes=shapes)
 
-    print(fig)
     return fig
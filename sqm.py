@@ -1,5 +1,4 @@
-from datetime import datetime
-from io import StringIO
+from io import BytesIO
 from zoneinfo import ZoneInfo
 
 import numpy as np
@@ -17,8 +16,25 @@ class SQM:
     MSAS = 4
     RECORD_TYPE = 5
 
+    DTYPES = {
+        DATETIME_UTC: str,
+        DATETIME_LOCAL: str,
+        TEMPERATURE: np.float32,
+        VOLTAGE: np.float32,
+        MSAS: np.float32,
+        RECORD_TYPE: "Int8",
+    }
+
     def __init__(self, uploaded_file):
-        self.header = SQM._read_header(uploaded_file)
+        if isinstance(uploaded_file, str):
+            infile = open(uploaded_file, "rb")
+        else:
+            infile = BytesIO(uploaded_file.getvalue())
+
+        # The header is read line by line, leaving `infile` positioned at the start of the data for `read_csv`
+        with infile:
+            self.header = SQM._read_header(infile)
+            self.data = pd.read_csv(infile, sep=";", header=None, dtype=SQM.DTYPES)
 
         try:
             self.latitude, self.longitude, self.elevation = (
@@ -30,65 +46,68 @@ class SQM:
 
         self.timezone = ZoneInfo(self.header["Local timezone"])
 
-        self.data = pd.read_csv(
-            uploaded_file,
-            skiprows=int(self.header["Number of header lines"]),
-            sep=";",
-            header=None,
+        self.data["datetime"] = pd.to_datetime(
+            self.data[self.DATETIME_UTC], format="ISO8601", utc=True
+        )
+        # Times that are ambiguous or nonexistent due to DST are resolved like `datetime(..., tzinfo=timezone)` would
+        self.data["local_datetime"] = pd.to_datetime(
+            self.data[self.DATETIME_LOCAL], format="ISO8601"
+        ).dt.tz_localize(
+            self.timezone,
+            ambiguous=np.ones(len(self.data), dtype=bool),
+            nonexistent=pd.Timedelta(hours=1),
         )
-        self.data["datetime"] = [
-            datetime.fromisoformat(t + "Z") for t in self.data[self.DATETIME_UTC]
-        ]
-        self.data["local_datetime"] = [
-            datetime.fromisoformat(t) for t in self.data[self.DATETIME_LOCAL]
-        ]
-        self.data["local_datetime"] = [
-            datetime(
-                dt.year,
-                dt.month,
-                dt.day,
-                dt.hour,
-                dt.minute,
-                dt.second,
-                tzinfo=self.timezone,
-            )
-            for dt in self.data["local_datetime"]
-        ]
         # Formula: NELM=7.93-5*log(10^(4.316-(Bmpsas/5))+1)
         # Source: Olof Carlin, Nils. About Bradley E. Schaefer: Telescopic limiting Magnitudes . . . .
         # Web page discussion of brightness in Schaefer (1990) and Clark (1994).
         # http://w1.411.telia.com/~u41105032/visual/Schaefer.htm (accessed 7/2003)
         # via http://unihedron.com/projects/darksky/NELM2BCalc.html
-        self.data["NELM"] = 7.93 - 5 * np.log(
-            10.0 ** (4.316 - (self.data[SQM.MSAS] / 5.0)) + 1.0
-        )
+        # Evaluated in place on a single buffer to avoid allocating a temporary array per operation
+        nelm = self.data[SQM.MSAS].to_numpy(dtype=np.float32, copy=True)
+        nelm /= -5.0
+        nelm += 4.316
+        np.power(10.0, nelm, out=nelm)
+        nelm += 1.0
+        np.log(nelm, out=nelm)
+        nelm *= -5.0
+        nelm += 7.93
+        self.data["NELM"] = nelm
 
     @staticmethod
     def merge_sqm_objects(objects):
         return objects
 
     @staticmethod
-    def _read_header(uploaded_file) -> dict:
+    def _read_header(infile) -> dict:
+        """
+        Read the "#" header lines from a binary file, leaving it positioned at the first line of data
+
+        Lines that do not start with "#" (such as blank lines) are skipped until the "# END OF HEADER" line. If that line
+        is missing, the data is taken to start at the first line containing ";".
+        """
         header = {}
+        data_position = None
 
-        if isinstance(uploaded_file, str):
-            infile = open(uploaded_file)
-        else:
-            stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
-            string_data = stringio.read()
-            infile = string_data.split("\n")
-
-        for line in infile:
-            if line.startswith("#"):
-                line = line.strip("#").strip()
-                fields = line.split(": ")
-                if len(fields) == 2:
-                    header[fields[0]] = fields[1]
-                elif "END OF HEADER" in line:
-                    break
+        while True:
+            position = infile.tell()
+            line = infile.readline()
+            if not line:
+                if data_position is not None:
+                    infile.seek(data_position)
+                break
+            # "utf-8-sig" drops the byte order mark that some editors add to the start of the file
+            line = line.decode("utf-8-sig").strip()
+            if not line.startswith("#"):
+                if data_position is None and ";" in line:
+                    data_position = position
+                continue
+            line = line.strip("#").strip()
+            if line == "END OF HEADER":
+                break
+            fields = line.split(": ")
+            if len(fields) == 2:
+                header[fields[0]] = fields[1]
 
-        if isinstance(uploaded_file, str):
-            infile.close()
         return header
 
     @staticmethod